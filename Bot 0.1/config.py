@@ -10,6 +10,8 @@ LOG_CHANNEL_ID = int(os.environ.get("LOG_CHANNEL_ID"))
 # Rate limiting
 MAX_FILE_SIZE_MB = 10
 MIN_INTERVAL_BETWEEN_FILES = 60  # seconds
+FILE_UPLOAD_BURST = 2  # files a user may send back to back
+MAX_TRACKED_USERS = 10_000  # least recently active users are forgotten first
 FLOOD_WAIT_BASE = 30  # seconds
 
 # Logging configuration
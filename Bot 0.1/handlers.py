@@ -1,25 +1,20 @@
 
-import asyncio
 import logging
 import csv
-import os
-import tempfile
-from typing import Dict, Any, BinaryIO
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+from itertools import chain
 from datetime import datetime
-from io import BytesIO
+from io import BytesIO, TextIOWrapper
 
 from aiogram import Bot, types
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
 
-from config import GROUP_ID, LOG_CHANNEL_ID, MIN_INTERVAL_BETWEEN_FILES
-from utils import extract_text_from_pdf, extract_questions_from_text, send_paginated_quizzes
+from config import GROUP_ID, LOG_CHANNEL_ID
+from utils import Question, extract_text_from_pdf_stream, extract_questions_in_worker, send_paginated_quizzes
 
 logger = logging.getLogger(__name__)
 
-# Dictionary to store user rate limits
-user_last_file_time: Dict[int, float] = {}
-
 async def start_command(message: types.Message):
     """Handle /start command"""
     await message.answer(
@@ -53,25 +48,21 @@ async def process_file(bot: Bot, message: types.Message, file_stream: BinaryIO,
     """
     Process uploaded file and send quizzes based on file type
     
+    The downloaded stream is parsed in memory; nothing is written to disk.
+    
     Args:
         bot: Telegram bot instance
         message: Original message with the file
         file_stream: File content as binary stream
         file_extension: File extension (csv or pdf)
     """
-    temp_path = None
     try:
-        # Create temporary file on disk
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}", mode="wb") as temp_file:
-            temp_file.write(file_stream.getvalue())
-            temp_path = temp_file.name
-
         await message.answer("✅ تم استلام الملف، جاري المعالجة...")
 
         if file_extension == "csv":
-            await process_csv_file(bot, message, temp_path)
+            await process_csv_file(bot, message, file_stream)
         elif file_extension == "pdf":
-            await process_pdf_file(bot, message, temp_path)
+            await process_pdf_file(bot, message, file_stream)
 
     except Exception as e:
         error_message = f"خطأ في معالجة الملف: {str(e)}"
@@ -88,106 +79,202 @@ async def process_file(bot: Bot, message: types.Message, file_stream: BinaryIO,
             
         # Send user-friendly message
         await message.reply("❌ حدث خطأ أثناء معالجة الملف. تم إبلاغ المسؤول بالمشكلة.")
-    finally:
-        # Delete temporary file
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
 
-async def process_csv_file(bot: Bot, message: types.Message, file_path: str) -> None:
+# Limits for the per-file error summary sent to the log channel
+MAX_REPORTED_ERRORS = 50
+MAX_REPORT_LENGTH = 4000
+
+async def report_errors(bot: Bot, message: types.Message, errors: List[str]) -> None:
     """
-    Process CSV file and send quizzes
+    Send the problems collected while processing a file to the log channel
+    
+    All problems go out as one message instead of one request each, so
+    the log channel does not compete with the quizzes for rate limits.
     
     Args:
         bot: Telegram bot instance
         message: Original message with the file
-        file_path: Path to CSV file
+        errors: Problems found while processing, one line each
     """
+    if not errors:
+        return
+    
+    lines = errors[:MAX_REPORTED_ERRORS]
+    if len(errors) > MAX_REPORTED_ERRORS:
+        lines.append(f"... and {len(errors) - MAX_REPORTED_ERRORS} more")
+    
+    report = (
+        f"⚠️ {len(errors)} problems in file from user {message.from_user.first_name} ({message.from_user.id}):\n"
+        + "\n".join(lines)
+    )
     try:
-        with open(file_path, encoding="utf-8") as f:
-            reader = csv.reader(f)
-            rows = list(reader)
+        await bot.send_message(LOG_CHANNEL_ID, report[:MAX_REPORT_LENGTH], parse_mode=None)
+    except Exception as log_err:
+        logger.error(f"Failed to send error summary to log channel: {log_err}")
+
+def _parse_csv_rows(reader: Iterable[List[str]], errors: List[str],
+                    stopped_at: Optional[List[int]] = None) -> Iterator[Question]:
+    """
+    Parse CSV rows into questions lazily, skipping invalid rows
+    
+    Quizzes are sent while the file is still being read, so a row that
+    cannot be decoded or parsed ends the file there instead of aborting
+    the upload halfway through.
+    
+    Args:
+        reader: CSV reader (or any iterable of rows)
+        errors: List that receives a line for every skipped row
+        stopped_at: List that receives the number of the row reading
+            stopped at, if the rest of the file could not be read
+        
+    Yields:
+        Questions in the format expected by send_paginated_quizzes
+    """
+    def skip(reason: str) -> None:
+        logger.warning(f"Skipped row {i+1}: {reason}")
+        errors.append(f"Row {i+1}: {reason}")
+    
+    rows = iter(reader)
+    i = -1
+    while True:
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        except (UnicodeDecodeError, csv.Error) as e:
+            logger.error(f"Could not read row {i+2}, skipping the rest of the file: {str(e)}")
+            errors.append(f"Row {i+2}: could not be read, rest of the file skipped ({str(e)})")
+            if stopped_at is not None:
+                stopped_at.append(i + 2)
+            return
+        i += 1
+        
+        try:
+            if len(row) < 2:
+                skip("incomplete")
+                continue
+            
+            question = row[0].strip()
+            if not question:
+                skip("no question")
+                continue
+                
+            correct_option = row[-1].strip()
+            
+            if not correct_option:
+                skip("no correct answer")
+                continue
+            
+            # Note where the correct option lands while collecting options
+            options = []
+            correct_index = None
+            for opt in row[1:-1]:
+                opt = opt.strip()
+                if not opt:
+                    continue
+                if correct_index is None and opt == correct_option:
+                    correct_index = len(options)
+                options.append(opt)
+                
+            if len(options) < 1:
+                skip("not enough options")
+                continue
             
-            if not rows:
+            # Make sure correct option is in options
+            if correct_index is None:
+                correct_index = len(options)
+                options.append(correct_option)
+            
+            # Limit options to 10 (Telegram limit)
+            if len(options) > 10:
+                if correct_index >= 10:
+                    skip("correct answer is beyond the first 10 options")
+                    continue
+                options = options[:10]
+                logger.warning(f"Trimmed options for question {i+1} to 10")
+            
+            if len(options) < 2:
+                options.append("لا أعرف الإجابة")
+            
+            question_data = Question(question, options, correct_index)
+            
+        except Exception as e:
+            logger.error(f"Error processing row {i+1}: {str(e)}")
+            errors.append(f"Row {i+1}: {str(e)}")
+            continue
+        
+        yield question_data
+
+async def process_csv_file(bot: Bot, message: types.Message, file_stream: BinaryIO) -> None:
+    """
+    Process CSV file and send quizzes
+    
+    Rows are parsed while the quizzes are being sent instead of loading
+    the whole file into memory first.
+    
+    Args:
+        bot: Telegram bot instance
+        message: Original message with the file
+        file_stream: CSV content as binary stream
+    """
+    try:
+        with TextIOWrapper(file_stream, encoding="utf-8", newline="") as f:
+            # The total is only known once parsing is done, so just check
+            # that there is something to parse
+            if not f.readline():
                 await message.reply("❌ الملف CSV فارغ!")
                 return
-                
-            total_rows = len(rows)
-            await message.reply(f"🔄 جاري معالجة {total_rows} سؤال من ملف CSV...")
+            
+            f.seek(0)
+            await message.reply("🔄 جاري معالجة الملف...")
             
             # Prepare questions in proper format
-            questions = []
-            for i, row in enumerate(rows):
-                try:
-                    if len(row) < 2:
-                        logger.warning(f"Skipped row {i+1}: incomplete")
-                        continue
-                    
-                    question = row[0].strip()
-                    if not question:
-                        logger.warning(f"Skipped row {i+1}: no question")
-                        continue
-                        
-                    options = [opt.strip() for opt in row[1:-1] if opt.strip()]
-                    correct_option = row[-1].strip()
-                    
-                    if not correct_option:
-                        logger.warning(f"Skipped row {i+1}: no correct answer")
-                        continue
-                        
-                    if len(options) < 1:
-                        logger.warning(f"Skipped row {i+1}: not enough options")
-                        continue
-                    
-                    # Make sure correct option is in options
-                    if correct_option not in options:
-                        options.append(correct_option)
-                    
-                    # Limit options to 10 (Telegram limit)
-                    if len(options) > 10:
-                        options = options[:10]
-                        logger.warning(f"Trimmed options for question {i+1} to 10")
-                    
-                    if len(options) < 2:
-                        options.append("لا أعرف الإجابة")
-                    
-                    questions.append({
-                        "question": question,
-                        "options": options,
-                        "correct_option_id": options.index(correct_option)
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"Error processing row {i+1}: {str(e)}")
+            errors: List[str] = []
+            stopped_at: List[int] = []
+            questions = _parse_csv_rows(csv.reader(f), errors, stopped_at)
+            first_question = next(questions, None)
             
             # Send questions with pagination
-            if questions:
-                sent_count, error_count = await send_paginated_quizzes(bot, questions, GROUP_ID)
+            if first_question is not None:
+                sent_count, error_count = await send_paginated_quizzes(
+                    bot, chain((first_question,), questions), GROUP_ID, errors=errors
+                )
                 
                 # Send final report
                 await message.reply(
                     f"✅ اكتملت العملية!\n"
+                    f"- عدد الأسئلة: {sent_count + error_count} سؤال\n"
                     f"- تم إرسال: {sent_count} سؤال\n"
                     f"- تم تخطي: {error_count} سؤال"
                 )
             else:
                 await message.reply("❌ لم يتم العثور على أسئلة صالحة في الملف CSV.")
+            
+            if stopped_at:
+                await message.reply(
+                    f"⚠️ تعذرت قراءة الملف من السطر {stopped_at[0]}، "
+                    "لذلك لم تتم معالجة الأسئلة التي بعده. "
+                    "تأكد من أن الملف بترميز UTF-8 وبتنسيق CSV صحيح."
+                )
+            
+            await report_errors(bot, message, errors)
 
     except Exception as e:
         logger.error(f"Error processing CSV file: {str(e)}")
         raise
 
-async def process_pdf_file(bot: Bot, message: types.Message, file_path: str) -> None:
+async def process_pdf_file(bot: Bot, message: types.Message, file_stream: BinaryIO) -> None:
     """
     Process PDF file and send quizzes
     
     Args:
         bot: Telegram bot instance
         message: Original message with the file
-        file_path: Path to PDF file
+        file_stream: PDF content as binary stream
     """
     try:
         # Extract text from PDF
-        extracted_text = await extract_text_from_pdf(file_path)
+        extracted_text = await extract_text_from_pdf_stream(file_stream.getvalue())
 
         if not extracted_text.strip():
             await message.reply("❌ لم يتم العثور على أي نص داخل ملف PDF، تأكد من أن الملف يحتوي على أسئلة مكتوبة كنصوص وليس صور.")
@@ -196,8 +283,8 @@ async def process_pdf_file(bot: Bot, message: types.Message, file_path: str) ->
         # Send processing message
         processing_msg = await message.reply("🔍 جاري تحليل النص واستخراج الأسئلة...")
         
-        # Extract questions
-        questions = extract_questions_from_text(extracted_text)
+        # Extract questions (regex-heavy, so keep it off the event loop)
+        questions = await extract_questions_in_worker(extracted_text)
 
         if not questions:
             # Send preview of extracted text to help diagnose the issue
@@ -222,7 +309,8 @@ async def process_pdf_file(bot: Bot, message: types.Message, file_path: str) ->
             await message.reply(f"✅ تم استخراج {len(questions)} سؤال فريد، سيتم إرسالها إلى المجموعة...")
             
             # Send questions with pagination
-            sent_count, error_count = await send_paginated_quizzes(bot, questions, GROUP_ID)
+            errors: List[str] = []
+            sent_count, error_count = await send_paginated_quizzes(bot, questions, GROUP_ID, errors=errors)
             
             # Send final report
             await message.reply(
@@ -230,6 +318,7 @@ async def process_pdf_file(bot: Bot, message: types.Message, file_path: str) ->
                 f"- تم إرسال: {sent_count} سؤال\n"
                 f"- تم تخطي أو فشل: {error_count} سؤال"
             )
+            await report_errors(bot, message, errors)
 
     except Exception as e:
         logger.error(f"Error processing PDF file: {str(e)}")
@@ -238,18 +327,8 @@ async def process_pdf_file(bot: Bot, message: types.Message, file_path: str) ->
 async def handle_document(bot: Bot, message: types.Message):
     """Handle document upload (PDF or CSV files)"""
     user_id = message.from_user.id
-    current_time = asyncio.get_event_loop().time()
-    
-    # Check rate limits
-    if user_id in user_last_file_time:
-        time_diff = current_time - user_last_file_time[user_id]
-        if time_diff < MIN_INTERVAL_BETWEEN_FILES:
-            await message.reply(
-                f"⏳ يرجى الانتظار {MIN_INTERVAL_BETWEEN_FILES - int(time_diff)} ثانية قبل إرسال ملف آخر."
-            )
-            return
     
-    user_last_file_time[user_id] = current_time
+    # Upload rate limits are checked by RateLimitMiddleware
     logger.info(f"Processing file from user {message.from_user.first_name} ({user_id})")
     
     try:
@@ -6,8 +6,9 @@ from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
 
-from config import TELEGRAM_TOKEN, LOG_CHANNEL_ID
+from config import TELEGRAM_TOKEN, LOG_CHANNEL_ID, MIN_INTERVAL_BETWEEN_FILES, FILE_UPLOAD_BURST, MAX_TRACKED_USERS
 from handlers import start_command, help_command, handle_document
+from middlewares import RateLimitMiddleware
 
 # Initialize logging
 logger = logging.getLogger(__name__)
@@ -17,6 +18,9 @@ from aiogram.client.default import DefaultBotProperties
 bot = Bot(token=TELEGRAM_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher()
 
+# Limit file uploads per user before they reach the handlers
+dp.message.middleware(RateLimitMiddleware(MIN_INTERVAL_BETWEEN_FILES, FILE_UPLOAD_BURST, MAX_TRACKED_USERS))
+
 # Register command handlers
 dp.message(Command("start"))(start_command)
 dp.message(Command("help"))(help_command)
@@ -0,0 +1,69 @@
+import logging
+import math
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from aiogram import BaseMiddleware, types
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class RateLimitMiddleware(BaseMiddleware):
+    """
+    Per-user token bucket for file uploads, checked before the handler runs.
+    
+    Tokens refill at one per `interval` seconds up to `burst`, so short
+    bursts are allowed while the long-term rate stays the same. A bucket
+    that has not been touched for `interval * burst` seconds is full again,
+    so it is dropped from the cache after that long; users beyond
+    `max_users` are evicted least recently used first.
+    """
+    
+    def __init__(self, interval: float, burst: int = 1, max_users: int = 10_000):
+        self.rate = 1 / interval
+        self.burst = burst
+        # user_id -> (tokens, last_refill)
+        self._buckets: "TTLCache[int, Tuple[float, float]]" = TTLCache(
+            maxsize=max_users, ttl=interval * burst
+        )
+    
+    def try_consume(self, user_id: int) -> float:
+        """
+        Take an upload token from the user's bucket
+        
+        Args:
+            user_id: Telegram user ID
+        
+        Returns:
+            0 if the upload is allowed, otherwise seconds until it will be
+        """
+        now = self._buckets.timer()
+        tokens, last_refill = self._buckets.get(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last_refill) * self.rate)
+        
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        
+        self._buckets[user_id] = (tokens, now)
+        return wait
+    
+    async def __call__(
+        self,
+        handler: Callable[[types.Message, Dict[str, Any]], Awaitable[Any]],
+        event: types.Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Only file uploads are limited; commands go straight through
+        if event.document is None or event.from_user is None:
+            return await handler(event, data)
+        
+        wait = self.try_consume(event.from_user.id)
+        if wait:
+            logger.info(f"Upload from user {event.from_user.id} rate limited for {wait:.0f}s")
+            return await event.reply(
+                f"⏳ يرجى الانتظار {math.ceil(wait)} ثانية قبل إرسال ملف آخر."
+            )
+        
+        return await handler(event, data)
@@ -2,25 +2,336 @@
 import logging
 import fitz
 import re
+import os
 import asyncio
-from typing import List, Dict, Any, Set, Tuple, Optional
+import functools
+import heapq
+import multiprocessing
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import List, Set, Tuple, Optional, Iterable, Sized, Union
 from aiogram import Bot
 
+try:
+    import hyperscan
+except ImportError:  # Optional: without it every pattern scans the full text
+    hyperscan = None
+
 logger = logging.getLogger(__name__)
 
+# Patterns for different question formats. Numbering styles that share a
+# layout are alternatives of one pattern, so the text is swept once per
+# layout instead of once per style; the decoder tells them apart by the
+# first option character.
+_RAW_PATTERNS = (
+    # Pattern 1: Options a) b) c) d), A) B) C) D), أ) ب) ج) د) or 1) 2) 3) 4)
+    r"(\d+[-\.]?\s*)(.*?)\n+("
+    r"(?:[a-d]\).*?(?:\n[a-d]\).*?){1,5})"
+    r"|(?:[A-D]\).*?(?:\n[A-D]\).*?){1,5})"
+    r"|(?:[\u0623-\u064A]\).*?(?:\n[\u0623-\u064A]\).*?){1,5})"
+    r"|(?:[1-9]\).*?(?:\n[1-9]\).*?){1,5})"
+    r")\n+(?:Answer|Answers?|الإجابة|الاجابة):\s*([a-dA-D1-9\u0623-\u064A])\)?",
+    
+    # Pattern 2: Same numbering styles with a dot separator: a. b. c. d.
+    r"(\d+[-\.]?\s*)(.*?)\n+("
+    r"(?:[a-d]\.\s*.*?(?:\n[a-d]\.\s*.*?){1,5})"
+    r"|(?:[A-D]\.\s*.*?(?:\n[A-D]\.\s*.*?){1,5})"
+    r"|(?:[\u0623-\u064A]\.\s*.*?(?:\n[\u0623-\u064A]\.\s*.*?){1,5})"
+    r"|(?:[1-9]\.\s*.*?(?:\n[1-9]\.\s*.*?){1,5})"
+    r")\n+(?:Answer|Answers?|الإجابة|الاجابة):\s*([a-dA-D1-9\u0623-\u064A])",
+    
+    # Pattern 3: More flexible pattern for irregular formatting
+    r"(\d+[-\.]?\s*)(.*?)\n+(?:[^\n]*?choice.*?|[^\n]*?option.*?|[^\n]*?الخيار.*?)(?:\n[^\n]*?choice.*?|\n[^\n]*?option.*?|\n[^\n]*?الخيار.*?){1,5}\n+(?:answer|answers?|الإجابة|الاجابة):\s*([a-dA-D1-9\u0623-\u064A])",
+    
+    # Pattern 4: More flexible format for options (a - option, b - option)
+    r"(\d+[-\.]?\s*)(.*?)\n+([a-dA-D])\s*[-–—]\s*(.*?)(?:\n([a-dA-D])\s*[-–—]\s*(.*?)){1,5}\n+(?:Answer|Answers?):\s*([a-dA-D])"
+)
+
+_QUESTION_PATTERNS = tuple(re.compile(p, re.DOTALL) for p in _RAW_PATTERNS)
+
+@functools.cache
+def _prefilter_db():
+    """
+    Compile all question patterns into a single Hyperscan database.
+    
+    The database runs in prefilter mode: it may report a pattern that the
+    `re` engine later rejects, but never misses one, so it is only used to
+    skip patterns that cannot match. It is compiled on first use rather
+    than at import, so worker processes that only extract PDF pages never
+    pay for it.
+    
+    Returns:
+        Compiled database, or None if Hyperscan is unavailable
+    """
+    if hyperscan is None:
+        return None
+    
+    flags = (hyperscan.HS_FLAG_DOTALL | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+             | hyperscan.HS_FLAG_PREFILTER | hyperscan.HS_FLAG_SINGLEMATCH)
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            # Hyperscan uses PCRE syntax for code points: \x{0623} instead of \u0623
+            expressions=[re.sub(r'\\u([0-9A-Fa-f]{4})', r'\\x{\1}', p).encode('utf-8') for p in _RAW_PATTERNS],
+            ids=list(range(len(_RAW_PATTERNS))),
+            flags=[flags] * len(_RAW_PATTERNS)
+        )
+        return db
+    except Exception as e:
+        logger.warning(f"Failed to compile Hyperscan database, falling back to re: {str(e)}")
+        return None
+
+def _candidate_pattern_ids(text: str) -> Optional[Set[int]]:
+    """
+    Find which question patterns may match the text in a single pass.
+    
+    Args:
+        text: Text to scan
+        
+    Returns:
+        Indexes into _QUESTION_PATTERNS, or None if no prefilter is available
+    """
+    db = _prefilter_db()
+    if db is None:
+        return None
+    
+    candidates: Set[int] = set()
+    
+    def on_match(pattern_id, start, end, flags, context):
+        candidates.add(pattern_id)
+    
+    try:
+        # Scratch space is per call so concurrent scans never share it
+        db.scan(
+            text.encode('utf-8'),
+            match_event_handler=on_match,
+            scratch=hyperscan.Scratch(db)
+        )
+    except Exception as e:
+        logger.warning(f"Hyperscan scan failed, trying all patterns: {str(e)}")
+        return None
+    
+    return candidates
+
+_ARABIC_OPTION_LETTERS = 'أبجدهوزحطي'
+
+# Option parser and answer decoder for each numbering type (a, A, أ, 1)
+_ANSWER_DECODERS = {
+    'lower': (
+        re.compile(r'([a-d]\))\s*(.*?)(?=\n[a-d]\)|$)', re.DOTALL),
+        lambda answer: ord(answer.lower()) - ord('a'),
+    ),
+    'upper': (
+        re.compile(r'([A-D]\))\s*(.*?)(?=\n[A-D]\)|$)', re.DOTALL),
+        lambda answer: ord(answer.upper()) - ord('A'),
+    ),
+    'ar': (
+        re.compile(r'([\u0623-\u064A]\))\s*(.*?)(?=\n[\u0623-\u064A]\)|$)', re.DOTALL),
+        _ARABIC_OPTION_LETTERS.find,
+    ),
+    'num': (
+        re.compile(r'([1-9]\))\s*(.*?)(?=\n[1-9]\)|$)', re.DOTALL),
+        lambda answer: int(answer) - 1,
+    ),
+}
+
+# Numbering type by first option character; anything else is numbered
+_OPTION_STYLES = {
+    **dict.fromkeys('abcd', 'lower'),
+    **dict.fromkeys('ABCD', 'upper'),
+    **dict.fromkeys(_ARABIC_OPTION_LETTERS, 'ar'),
+}
+
+# Whitespace cleanup
+# Runs of spaces become one space and blank lines become one empty line,
+# in a single pass: sub(r'\1\1\2') keeps "\n\n" or " " depending on the branch
+_WHITESPACE_RE = re.compile(r'(\n)\s*\n|( ) +')
+_EXTRA_NEWLINES_RE = re.compile(r'\n{3,}')
+
+# Wait time in Telegram's flood control errors
+_RETRY_RE = re.compile(r'retry after (\d+)')
+
+# Once a pattern yields this many questions it is taken to be the format of
+# the document, and the remaining patterns are not tried.
+MIN_EXPECTED_QUESTIONS = 5
+
+# PDFs with at least this many pages are split across worker processes.
+# PyMuPDF is not thread-safe, so pages cannot be shared between threads.
+PARALLEL_MIN_PAGES = 100
+_MAX_PDF_WORKERS = min(8, os.cpu_count() or 1)
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()  # used from the loop and the fitz thread
+
+# Every PyMuPDF call in this process runs on this one thread, so uploads
+# that arrive together never use fitz concurrently
+_fitz_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fitz")
+
 async def extract_text_from_pdf(pdf_path: str) -> str:
     """
     Extract text from PDF file with optimized formatting preservation.
     
+    The extraction runs on the PyMuPDF thread so a large PDF does not block
+    the event loop for other users.
+    
     Args:
         pdf_path: Path to the PDF file
         
     Returns:
         Extracted text with preserved formatting
     """
-    text = ""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_fitz_executor, _extract_text_from_pdf_sync, pdf_path)
+
+async def extract_text_from_pdf_stream(data: bytes) -> str:
+    """
+    Extract text from an in-memory PDF, without writing it to disk.
+    
+    Args:
+        data: PDF file content
+        
+    Returns:
+        Extracted text with preserved formatting
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_fitz_executor, _extract_text_from_pdf_sync, data)
+
+def _extract_pages(doc: fitz.Document, start: int, stop: int) -> List[str]:
+    """
+    Extract the text of pages [start, stop) of an open document.
+    
+    Args:
+        doc: Open PDF document
+        start: Index of the first page
+        stop: Index after the last page
+        
+    Returns:
+        Text of every page that could be extracted
+    """
+    page_texts = []
+    for page_num in range(start, stop):
+        try:
+            # Get text with better formatting
+            page_texts.append(doc[page_num].get_text("text"))
+        except Exception as e:
+            logger.error(f"Error extracting text from page {page_num+1}: {str(e)}")
+    return page_texts
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Worker process entry point: open the PDF and extract a range of pages"""
+    with fitz.open(pdf_path) as doc:
+        return _extract_pages(doc, start, stop)
+
+def _write_temp_file(data: bytes, suffix: str) -> str:
+    """
+    Write data to a new temporary file with unbuffered os.write calls.
+    
+    Args:
+        data: Content to write
+        suffix: File name suffix, e.g. ".pdf"
+        
+    Returns:
+        Path of the temporary file; the caller removes it
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    except BaseException:
+        os.close(fd)
+        os.remove(path)
+        raise
+    os.close(fd)
+    return path
+
+def _extract_pages_parallel(source: Union[str, bytes], page_count: int) -> List[str]:
+    """
+    Extract all pages with the worker pool, one page range per worker.
+    
+    Args:
+        source: Path to the PDF file, or its content
+        page_count: Number of pages in the PDF
+        
+    Returns:
+        Text of every page that could be extracted, in page order
+    """
+    temp_path = None
+    if isinstance(source, str):
+        pdf_path = source
+    else:
+        # Workers open the file themselves; a path is cheaper to send than the bytes
+        temp_path = pdf_path = _write_temp_file(source, ".pdf")
+    
+    try:
+        chunk_size = -(-page_count // _MAX_PDF_WORKERS)
+        starts = range(0, page_count, chunk_size)
+        stops = [min(start + chunk_size, page_count) for start in starts]
+        
+        parts = []
+        pool = _get_pdf_pool()
+        try:
+            for page_texts in pool.map(_extract_page_range, repeat(pdf_path), starts, stops):
+                parts.extend(page_texts)
+        except BrokenProcessPool:
+            _discard_broken_pool(pool)
+            raise
+        return parts
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Create the worker pool on first use and reuse it afterwards"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # Spawn rather than fork: the process already runs other threads
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=_MAX_PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdf_pool
+
+def _discard_broken_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Drop a pool whose worker died, so the next call starts a fresh one.
+    
+    Args:
+        pool: The pool that raised BrokenProcessPool
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+def _extract_text_from_pdf_sync(source: Union[str, bytes]) -> str:
+    """
+    Blocking implementation of extract_text_from_pdf and extract_text_from_pdf_stream.
+    
+    Large PDFs are split into page ranges extracted in parallel by a pool
+    of worker processes; smaller ones are read in this thread.
+    
+    Args:
+        source: Path to the PDF file, or its content
+        
+    Returns:
+        Extracted text with preserved formatting
+    """
+    # Collect pages and join once; repeated += copies the whole text per page
+    parts: List[str] = []
     try:
-        with fitz.open(pdf_path) as doc:
+        if isinstance(source, str):
+            doc = fitz.open(source)
+        else:
+            doc = fitz.open(stream=source, filetype="pdf")
+        
+        with doc:
             page_count = len(doc)
             if page_count == 0:
                 logger.warning("PDF is empty: no pages found")
@@ -28,23 +339,56 @@ async def extract_text_from_pdf(pdf_path: str) -> str:
                 
             logger.info(f"Processing PDF with {page_count} pages")
             
-            for page_num, page in enumerate(doc):
+            if page_count >= PARALLEL_MIN_PAGES and _MAX_PDF_WORKERS > 1:
                 try:
-                    # Get text with better formatting
-                    page_text = page.get_text("text")
-                    # Clean up excessive whitespace while preserving format
-                    page_text = re.sub(r' +', ' ', page_text)
-                    page_text = re.sub(r'\n\s*\n', '\n\n', page_text)
-                    
-                    text += page_text + "\n\n"
+                    parts = _extract_pages_parallel(source, page_count)
                 except Exception as e:
-                    logger.error(f"Error extracting text from page {page_num+1}: {str(e)}")
+                    logger.error(f"Parallel PDF extraction failed, reading pages sequentially: {str(e)}")
+                    parts = _extract_pages(doc, 0, page_count)
+            else:
+                parts = _extract_pages(doc, 0, page_count)
     except Exception as e:
         logger.error(f"Error opening PDF file: {str(e)}")
     
-    return text
+    if not parts:
+        return ""
+    # Clean up excessive whitespace in one pass over the whole text rather
+    # than per page
+    return _WHITESPACE_RE.sub(r'\1\1\2', "\n\n".join(parts) + "\n\n")
+
+@dataclass(slots=True)
+class Question:
+    """A quiz question ready to be sent as a Telegram poll"""
+    question: str
+    options: List[str]
+    correct_option_id: int
 
-def extract_questions_from_text(text: str) -> List[Dict[str, Any]]:
+def _mask_matches(text: str, matches: List[re.Match]) -> str:
+    """
+    Replace every matched span with a single NUL character.
+    
+    NUL never appears in extracted text, so no question number, option or
+    answer line inside a masked span can be matched again, and later
+    patterns scan a shorter text.
+    
+    Args:
+        text: Text the matches were found in
+        matches: Non-overlapping matches, in order
+        
+    Returns:
+        Text with the matched spans masked out
+    """
+    pieces = []
+    pos = 0
+    for match in matches:
+        start, end = match.span()
+        pieces.append(text[pos:start])
+        pieces.append('\x00')
+        pos = end
+    pieces.append(text[pos:])
+    return ''.join(pieces)
+
+def extract_questions_from_text(text: str) -> List[Question]:
     """
     Extract questions and answers from text with support for multiple formats.
     
@@ -55,54 +399,30 @@ def extract_questions_from_text(text: str) -> List[Dict[str, Any]]:
         List of questions with options and correct answers
     """
     # Clean up text
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = _EXTRA_NEWLINES_RE.sub('\n\n', text)
     
     # Log diagnostic info
     logger.info(f"Text extracted from PDF (first 500 chars): {text[:500]}...")
     logger.info(f"Total length of extracted text: {len(text)} characters")
     
-    questions = []
-    extracted_questions: Set[str] = set()
+    questions: List[Question] = []
+    extracted_hashes: Set[int] = set()
     
-    # Patterns for different question formats
-    patterns = [
-        # Pattern 1: Question with options a) b) c) d) and answer with letter b)
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-d]\).*?(?:\n[a-d]\).*?){1,5})\n+(?:Answer|Answers?):\s*([a-d])\)?",
-        
-        # Pattern 2: Question with options a) b) c) d) and answer with letter and parenthesis like b)
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-d]\).*?(?:\n[a-d]\).*?){1,5})\n+(?:Answer|Answers?):\s*([a-d])\)",
-        
-        # More flexible pattern
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-d]\)\s*.*?(?:\n[a-d]\)\s*.*?){1,5})\n+(?:Answer|Answers?):\s*([a-d])\)?",
-        
-        # Pattern 3: Question with options A) B) C) D) (uppercase)
-        r"(\d+[-\.]?\s*)(.*?)\n+([A-D]\).*?(?:\n[A-D]\).*?){1,5})\n+(?:Answer|Answers?):\s*([A-D])",
-        
-        # Pattern 4: Question with options أ) ب) ج) د) (Arabic)
-        r"(\d+[-\.]?\s*)(.*?)\n+([\u0623-\u064A]\).*?(?:\n[\u0623-\u064A]\).*?){1,5})\n+(?:الإجابة|الاجابة):\s*([\u0623-\u064A])",
-        
-        # Pattern 5: Question with options 1) 2) 3) 4)
-        r"(\d+[-\.]?\s*)(.*?)\n+([1-9]\).*?(?:\n[1-9]\).*?){1,5})\n+(?:Answer|Answers?):\s*([1-9])",
-        
-        # Pattern 6-9: Various formats with different separators and languages
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-d]\.\s*.*?(?:\n[a-d]\.\s*.*?){1,5})\n+(?:Answer|Answers?):\s*([a-d])",
-        r"(\d+[-\.]?\s*)(.*?)\n+([A-D]\.\s*.*?(?:\n[A-D]\.\s*.*?){1,5})\n+(?:Answer|Answers?):\s*([A-D])",
-        r"(\d+[-\.]?\s*)(.*?)\n+([\u0623-\u064A]\.\s*.*?(?:\n[\u0623-\u064A]\.\s*.*?){1,5})\n+(?:الإجابة|الاجابة):\s*([\u0623-\u064A])",
-        r"(\d+[-\.]?\s*)(.*?)\n+([1-9]\.\s*.*?(?:\n[1-9]\.\s*.*?){1,5})\n+(?:Answer|Answers?):\s*([1-9])",
-        
-        # Pattern 10: More flexible pattern for irregular formatting
-        r"(\d+[-\.]?\s*)(.*?)\n+(?:[^\n]*?choice.*?|[^\n]*?option.*?|[^\n]*?الخيار.*?)(?:\n[^\n]*?choice.*?|\n[^\n]*?option.*?|\n[^\n]*?الخيار.*?){1,5}\n+(?:answer|answers?|الإجابة|الاجابة):\s*([a-dA-D1-9\u0623-\u064A])",
-        
-        # Pattern 11: More flexible format for options (a - option, b - option)
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-dA-D])\s*[-–—]\s*(.*?)(?:\n([a-dA-D])\s*[-–—]\s*(.*?)){1,5}\n+(?:Answer|Answers?):\s*([a-dA-D])"
-    ]
+    # Skip patterns that cannot match anywhere in the text
+    candidates = _candidate_pattern_ids(text)
     
     # Process each pattern
-    for i, pattern in enumerate(patterns):
-        matches = re.findall(pattern, text, re.DOTALL)
-        logger.info(f"Pattern {i+1}: Found {len(matches)} matches")
+    for i, pattern in enumerate(_QUESTION_PATTERNS):
+        if candidates is not None and i not in candidates:
+            logger.info(f"Pattern {i+1}: No candidates, skipped")
+            continue
+        
+        found = list(pattern.finditer(text))
+        logger.info(f"Pattern {i+1}: Found {len(found)} matches")
+        added = 0
         
-        for match in matches:
+        for found_match in found:
+            match = found_match.groups()
             try:
                 question_num = match[0].strip()
                 question_text = match[1].strip()
@@ -115,25 +435,9 @@ def extract_questions_from_text(text: str) -> List[Dict[str, Any]]:
                 options_text = match[2].strip()
                 
                 # Determine numbering type (a, A, أ, 1)
-                if options_text.startswith(('a', 'b', 'c', 'd')):
-                    options_raw = re.findall(r'([a-d]\))\s*(.*?)(?=\n[a-d]\)|$)', options_text, re.DOTALL)
-                    correct_answer = match[3].strip().lower()
-                    if correct_answer.endswith(')'):
-                        correct_answer = correct_answer[:-1]
-                    correct_index = ord(correct_answer) - ord('a')
-                elif options_text.startswith(('A', 'B', 'C', 'D')):
-                    options_raw = re.findall(r'([A-D]\))\s*(.*?)(?=\n[A-D]\)|$)', options_text, re.DOTALL)
-                    correct_answer = match[3].strip().upper()
-                    correct_index = ord(correct_answer) - ord('A')
-                elif options_text[0] in 'أبجدهوزحطي':  # Arabic letters
-                    options_raw = re.findall(r'([\u0623-\u064A]\))\s*(.*?)(?=\n[\u0623-\u064A]\)|$)', options_text, re.DOTALL)
-                    correct_answer = match[3].strip()
-                    arabic_options = 'أبجدهوزحطي'
-                    correct_index = arabic_options.find(correct_answer)
-                else:  # Numbers
-                    options_raw = re.findall(r'([1-9]\))\s*(.*?)(?=\n[1-9]\)|$)', options_text, re.DOTALL)
-                    correct_answer = match[3].strip()
-                    correct_index = int(correct_answer) - 1
+                option_re, decode_answer = _ANSWER_DECODERS[_OPTION_STYLES.get(options_text[0], 'num')]
+                options_raw = option_re.findall(options_text)
+                correct_index = decode_answer(match[3].strip())
                 
                 options = []
                 for opt in options_raw:
@@ -142,32 +446,137 @@ def extract_questions_from_text(text: str) -> List[Dict[str, Any]]:
                 
                 # Ensure correct answer is within range
                 if 0 <= correct_index < len(options):
-                    # Create unique ID for question
-                    question_id = question_text[:50]
-                    if question_id not in extracted_questions:
-                        questions.append({
-                            "question": question_text,
-                            "options": options,
-                            "correct_option_id": correct_index
-                        })
-                        extracted_questions.add(question_id)
-                        logger.info(f"Added new question: {question_id}")
+                    # Dedupe on a hash of the whole question text, so only an
+                    # int is stored per question
+                    question_hash = hash(question_text)
+                    if question_hash not in extracted_hashes:
+                        questions.append(Question(question_text, options, correct_index))
+                        extracted_hashes.add(question_hash)
+                        added += 1
+                        logger.info(f"Added new question: {question_text[:50]}")
                     else:
-                        logger.info(f"Skipped duplicate question: {question_id}")
+                        logger.info(f"Skipped duplicate question: {question_text[:50]}")
             except Exception as e:
                 logger.warning(f"Error extracting question: {str(e)}")
                 continue
+        
+        # Most files use a single format, so stop at the first one that fits
+        if added >= MIN_EXPECTED_QUESTIONS:
+            logger.info(f"Pattern {i+1}: Matched {added} questions, skipping remaining patterns")
+            break
+        
+        # Later patterns only search what this one did not already match
+        if found:
+            text = _mask_matches(text, found)
     
     return questions
 
-async def send_paginated_quizzes(bot: Bot, questions: List[Dict[str, Any]], chat_id: int) -> Tuple[int, int]:
+async def extract_questions_in_worker(text: str) -> List[Question]:
+    """
+    Run extract_questions_from_text in the worker pool.
+    
+    The regex engine holds the GIL for a whole search, so a worker thread
+    would still stall the event loop; a worker process does not.
+    
+    Args:
+        text: Text extracted from PDF
+        
+    Returns:
+        List of questions with options and correct answers
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_pdf_pool()
+    try:
+        return await loop.run_in_executor(pool, extract_questions_from_text, text)
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            _discard_broken_pool(pool)
+        logger.error(f"Question extraction in worker failed, parsing here instead: {str(e)}")
+        return extract_questions_from_text(text)
+
+class TokenBucket:
+    """
+    Token bucket rate limiter for outgoing Telegram requests.
+    
+    Tokens refill continuously at `rate` per second up to `capacity`;
+    each request takes one token and waits when none are left. Waiters are
+    served lowest `key` first, so a request retried under its original key
+    goes ahead of later ones already waiting. A pause holds every waiter
+    back until its deadline.
+    """
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.resume_at = 0.0
+        self._waiting: List[float] = []  # heap of waiting keys
+        self._changed = asyncio.Condition()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+    
+    def _delay(self) -> float:
+        """Seconds until the next token can be taken"""
+        self._refill()
+        return max(self.resume_at - self.last_refill, (1 - self.tokens) / self.rate, 0)
+    
+    async def acquire(self, key: float = 0) -> None:
+        """
+        Wait until no lower key is waiting and a token is available, then take it
+        
+        Args:
+            key: Position in the queue, e.g. the number of the quiz being sent
+        """
+        heapq.heappush(self._waiting, key)
+        async with self._changed:
+            try:
+                while True:
+                    # Only the lowest key waits for a token; the rest wait
+                    # for it to go. A pause may be extended meanwhile, so the
+                    # delay is checked again after every wake-up.
+                    delay = self._delay() if self._waiting[0] == key else None
+                    if delay == 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                self.tokens -= 1
+            finally:
+                self._waiting.remove(key)
+                heapq.heapify(self._waiting)
+                self._changed.notify_all()
+    
+    def pause(self, seconds: float) -> None:
+        """
+        Hold back every sender for `seconds` (e.g. Telegram's retry after).
+        
+        Overlapping pauses do not add up: the later deadline wins.
+        """
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+async def send_paginated_quizzes(bot: Bot, questions: Iterable[Question], chat_id: int,
+                                 total: Optional[int] = None,
+                                 errors: Optional[List[str]] = None) -> Tuple[int, int]:
     """
     Send questions as quizzes with pagination to avoid Telegram limits.
     
+    Questions are consumed lazily, so a generator can feed quizzes while
+    the source file is still being parsed. Sends are paced by a token
+    bucket instead of fixed sleeps, with a few requests allowed in flight
+    so a slow response does not delay the next quiz. A new quiz starts as
+    soon as one of those slots frees up, without waiting for a whole batch.
+    
     Args:
         bot: Telegram bot instance
-        questions: List of questions to send
+        questions: Questions to send (list or any iterable)
         chat_id: Chat ID to send quizzes to
+        total: Number of questions, if known; defaults to len(questions)
+        errors: List that receives a line for every question that failed
         
     Returns:
         Tuple of (sent_count, error_count)
@@ -175,86 +584,138 @@ async def send_paginated_quizzes(bot: Bot, questions: List[Dict[str, Any]], chat
     sent_count = 0
     error_count = 0
     
-    # Send initial message
-    await bot.send_message(chat_id, f"🔄 Sending {len(questions)} questions...")
+    if total is None and isinstance(questions, Sized):
+        total = len(questions)
+    of_total = f"/{total}" if total is not None else ""
     
     # Constants for pagination
-    BATCH_SIZE = 5
-    SMALL_DELAY = 3
-    MEDIUM_DELAY = 10
-    LARGE_DELAY = 30
-    
-    # Process in batches
-    for i in range(0, len(questions), BATCH_SIZE):
-        batch = questions[i:i+BATCH_SIZE]
+    BATCH_SIZE = 5  # Questions between progress updates
+    CONCURRENCY = 5
+    SEND_RATE = 1 / 3  # Telegram allows about 20 messages per minute in a group
+    BURST = 1  # Polls started together may arrive out of order
+    RETRY_DELAY = 10
+    
+    bucket = TokenBucket(SEND_RATE, BURST)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    
+    # Send initial message
+    await bucket.acquire(0)
+    if total is not None:
+        await bot.send_message(chat_id, f"🔄 Sending {total} questions...")
+    else:
+        await bot.send_message(chat_id, "🔄 Sending questions...")
+    
+    async def send_quiz(q: Question, number: int) -> None:
+        nonlocal sent_count, error_count
         
-        # Process each question in batch
-        for q_index, q in enumerate(batch):
+        try:
+            await bucket.acquire(number)
             try:
                 await bot.send_poll(
                     chat_id=chat_id,
-                    question=q["question"],
-                    options=q["options"],
+                    question=q.question,
+                    options=q.options,
                     type="quiz",
-                    correct_option_id=q["correct_option_id"],
+                    correct_option_id=q.correct_option_id,
                     is_anonymous=True
                 )
                 sent_count += 1
-                await asyncio.sleep(SMALL_DELAY)
+                return
                 
             except Exception as e:
                 error_count += 1
-                error_message = f"Error sending question {i + q_index + 1}: {str(e)}"
+                error_message = f"Error sending question {number}: {str(e)}"
                 logger.error(error_message)
                 
-                # Handle rate limiting
-                if "Flood control" in str(e) or "Too Many Requests" in str(e):
-                    retry_time = MEDIUM_DELAY
-                    
-                    try:
-                        retry_match = re.search(r'retry after (\d+)', str(e))
-                        if retry_match:
-                            retry_time = int(retry_match.group(1)) + 5
-                    except:
-                        pass
-                    
-                    await bot.send_message(
-                        chat_id, 
-                        f"⚠️ Telegram rate limit reached! Waiting {retry_time} seconds before continuing..."
-                    )
-                    logger.warning(f"Waiting {retry_time} seconds due to rate limits")
-                    await asyncio.sleep(retry_time)
-                    
-                    # Retry sending
-                    try:
-                        await bot.send_poll(
-                            chat_id=chat_id,
-                            question=q["question"],
-                            options=q["options"],
-                            type="quiz",
-                            correct_option_id=q["correct_option_id"],
-                            is_anonymous=True
-                        )
-                        sent_count += 1
-                        error_count -= 1
-                        await asyncio.sleep(SMALL_DELAY)
-                    except Exception as retry_error:
-                        logger.error(f"Retry failed for question {i + q_index + 1}: {str(retry_error)}")
-        
-        # Send batch progress update
-        if i + BATCH_SIZE < len(questions):
-            progress = i + BATCH_SIZE
-            await bot.send_message(
-                chat_id,
-                f"✅ Sent {progress}/{len(questions)} questions... ({sent_count} successful, {error_count} failed)"
-            )
+                # Only rate limit errors are retried
+                if not ("Flood control" in str(e) or "Too Many Requests" in str(e)):
+                    if errors is not None:
+                        errors.append(error_message)
+                    return
+                
+                retry_time = RETRY_DELAY
+                
+                try:
+                    retry_match = _RETRY_RE.search(str(e))
+                    if retry_match:
+                        retry_time = int(retry_match.group(1)) + 5
+                except:
+                    pass
+                
+                # Pause the whole bucket so the other senders back off too;
+                # the retry keeps its number, so it goes before later quizzes
+                bucket.pause(retry_time)
+                await bot.send_message(
+                    chat_id, 
+                    f"⚠️ Telegram rate limit reached! Waiting {retry_time} seconds before continuing..."
+                )
+                logger.warning(f"Waiting {retry_time} seconds due to rate limits")
+            
+            # Retry sending
+            await bucket.acquire(number)
+            try:
+                await bot.send_poll(
+                    chat_id=chat_id,
+                    question=q.question,
+                    options=q.options,
+                    type="quiz",
+                    correct_option_id=q.correct_option_id,
+                    is_anonymous=True
+                )
+                sent_count += 1
+                error_count -= 1
+            except Exception as retry_error:
+                logger.error(f"Retry failed for question {number}: {str(retry_error)}")
+                if errors is not None:
+                    errors.append(f"Retry failed for question {number}: {str(retry_error)}")
+        finally:
+            semaphore.release()
+    
+    async def send_progress(progress: int) -> None:
+        # Queued on the bucket right after the last quiz of its batch
+        await bucket.acquire(progress + 0.5)
+        await bot.send_message(
+            chat_id,
+            f"✅ Sent {progress}{of_total} questions... ({sent_count} successful, {error_count} failed)"
+        )
+    
+    pending: Set[asyncio.Task] = set()
+    failures: List[BaseException] = []
+    
+    def on_done(task: asyncio.Task) -> None:
+        pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            failures.append(task.exception())
+    
+    def start(coro) -> None:
+        task = asyncio.create_task(coro)
+        pending.add(task)
+        task.add_done_callback(on_done)
+    
+    # Start each quiz as soon as a slot frees up instead of waiting for the
+    # whole batch; the bucket sends them in number order
+    number = 0
+    try:
+        for q in questions:
+            if failures:
+                raise failures[0]
             
-            # Apply larger delay between batches
-            await asyncio.sleep(MEDIUM_DELAY)
+            # Queue batch progress update, only when more questions follow
+            if number and number % BATCH_SIZE == 0:
+                start(send_progress(number))
             
-            # Apply very large delay every 5 batches
-            if (i // BATCH_SIZE) % 5 == 4:
-                await bot.send_message(chat_id, "⏳ Taking a longer break to avoid Telegram limits...")
-                await asyncio.sleep(LARGE_DELAY)
+            await semaphore.acquire()
+            number += 1
+            start(send_quiz(q, number))
+        
+        if pending:
+            await asyncio.wait(pending)
+    except BaseException:
+        for task in pending:
+            task.cancel()
+        raise
+    
+    if failures:
+        raise failures[0]
     
     return sent_count, error_count
@@ -8,6 +8,10 @@ LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", "-1002300659776"))
 
 # Rate limiting
 MIN_INTERVAL_BETWEEN_FILES = 60  # seconds
+MAX_TRACKED_USERS = 10_000  # least recently active users are forgotten first
+
+# Forwarded quiz batches
+QUIZ_BATCH_TTL = 3600  # seconds before an unfinished batch is dropped
 
 # Logging configuration
 logging.basicConfig(
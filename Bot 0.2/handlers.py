@@ -1,23 +1,32 @@
 import logging
 import os
 import tempfile
+from dataclasses import dataclass, field
 from io import BytesIO
-from datetime import datetime, timedelta
 from typing import List, Dict, Any
 from aiogram import Bot, types
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
 from aiogram.types import Poll
+from cachetools import TTLCache
 
-from config import MIN_INTERVAL_BETWEEN_FILES
+from config import QUIZ_BATCH_TTL, MAX_TRACKED_USERS
 from utils import extract_text_from_pdf, extract_questions_from_text, send_telegram_quizzes, format_quiz_as_text
 
 logger = logging.getLogger(__name__)
 
-# Storage for temporary quiz batches
-user_quiz_batches = {}
-# Rate limiting
-user_last_file_time = {}
+# Telegram's limit on the length of a text message
+MAX_MESSAGE_LENGTH = 4096
+
+@dataclass(slots=True)
+class QuizBatch:
+    """Forwarded quizzes a user has collected since their last /finish"""
+    quizzes: List[Poll] = field(default_factory=list)
+
+# Storage for temporary quiz batches. Unfinished batches expire
+# QUIZ_BATCH_TTL seconds after they were started; beyond MAX_TRACKED_USERS
+# the least recently used batch is dropped.
+user_quiz_batches: "TTLCache[int, QuizBatch]" = TTLCache(maxsize=MAX_TRACKED_USERS, ttl=QUIZ_BATCH_TTL)
 
 async def start_command(message: types.Message):
     """Handle /start command"""
@@ -48,16 +57,7 @@ async def help_command(message: types.Message):
 async def handle_pdf_file(message: types.Message):
     """Process PDF file with improved error handling"""
     try:
-        user_id = message.from_user.id
-        
-        # Rate limiting
-        current_time = datetime.now().timestamp()
-        if user_id in user_last_file_time:
-            if (diff := current_time - user_last_file_time[user_id]) < MIN_INTERVAL_BETWEEN_FILES:
-                await message.reply(f"⏳ يرجى الانتظار {int(MIN_INTERVAL_BETWEEN_FILES - diff)} ثانية")
-                return
-        
-        user_last_file_time[user_id] = current_time
+        # Upload rate limits are checked by RateLimitMiddleware
 
         # Validate PDF
         if not message.document.file_name.lower().endswith('.pdf'):
@@ -70,9 +70,15 @@ async def handle_pdf_file(message: types.Message):
         file_stream = BytesIO()
         await message.bot.download(message.document, destination=file_stream)
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(file_stream.getvalue())
-            temp_path = temp_file.name
+        # One unbuffered write per chunk the kernel accepts, straight from
+        # the download buffer without copying it
+        fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            view = file_stream.getbuffer()
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
 
         # Extract text
         text = await extract_text_from_pdf(temp_path)
@@ -122,16 +128,14 @@ async def handle_forwarded_quiz(message: types.Message):
             return
 
         user_id = message.from_user.id
-        if user_id not in user_quiz_batches:
-            user_quiz_batches[user_id] = {
-                'quizzes': [],
-                'expires_at': datetime.now() + timedelta(hours=1)
-            }
+        batch = user_quiz_batches.get(user_id)
+        if batch is None:
+            batch = user_quiz_batches[user_id] = QuizBatch()
 
         quiz = message.poll
-        user_quiz_batches[user_id]['quizzes'].append(quiz)
+        batch.quizzes.append(quiz)
 
-        count = len(user_quiz_batches[user_id]['quizzes'])
+        count = len(batch.quizzes)
         await message.reply(
             f"📥 تم حفظ الاختبار ({count})\n"
             "اكتب /finish عندما تنتهي"
@@ -141,27 +145,52 @@ async def handle_forwarded_quiz(message: types.Message):
         logger.error(f"Quiz storage error: {e}", exc_info=True)
         await message.reply("❌ حدث خطأ أثناء حفظ الاختبار")
 
+def pack_message_parts(parts: List[str], limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Join text parts into as few messages as possible
+    
+    Parts are kept whole and packed greedily; only a part that is longer
+    than the limit on its own is cut.
+    
+    Args:
+        parts: Text pieces in order, e.g. one per quiz
+        limit: Maximum characters per message
+        
+    Returns:
+        Message texts, each at most `limit` characters long
+    """
+    messages = []
+    chunk = []
+    chunk_len = 0
+    for part in parts:
+        if chunk and chunk_len + len(part) > limit:
+            messages.append("".join(chunk))
+            chunk = []
+            chunk_len = 0
+        if len(part) > limit:
+            messages.extend(part[i:i+limit] for i in range(0, len(part), limit))
+            continue
+        chunk.append(part)
+        chunk_len += len(part)
+    if chunk:
+        messages.append("".join(chunk))
+    return messages
+
 async def finish_quiz_batch(message: types.Message):
     """Send all stored quizzes as a single message"""
     try:
         user_id = message.from_user.id
-        if user_id not in user_quiz_batches or not user_quiz_batches[user_id]['quizzes']:
+        batch = user_quiz_batches.pop(user_id, None)
+        if batch is None or not batch.quizzes:
             await message.reply("❌ لا توجد اختبارات محفوظة")
             return
 
-        quizzes = user_quiz_batches.pop(user_id)['quizzes']
-        message_text = "📝 الاختبارات المحفوظة:\n\n"
-        
-        for i, quiz in enumerate(quizzes, 1):
-            quiz_text = await format_quiz_as_text(quiz)
-            message_text += f"{i}. {quiz_text}\n\n"
-
-        # Split if too long
-        if len(message_text) > 4096:
-            parts = [message_text[i:i+4000] for i in range(0, len(message_text), 4000)]
-            for part in parts:
-                await message.reply(part)
-        else:
+        quizzes = batch.quizzes
+        parts = ["📝 الاختبارات المحفوظة:\n\n"]
+        parts.extend(f"{i}. {format_quiz_as_text(quiz)}\n\n" for i, quiz in enumerate(quizzes, 1))
+
+        # Split if too long, without cutting a quiz in half
+        for message_text in pack_message_parts(parts):
             await message.reply(message_text)
 
     except Exception as e:
@@ -1,17 +1,42 @@
 import asyncio
 import logging
 import signal
+from typing import Coroutine, Set
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.client.default import DefaultBotProperties
 
-from config import TELEGRAM_TOKEN, LOG_CHANNEL_ID
+try:
+    import uvloop
+except ImportError:  # Optional: not available on Windows, fall back to asyncio's loop
+    uvloop = None
+
+from config import TELEGRAM_TOKEN, LOG_CHANNEL_ID, MIN_INTERVAL_BETWEEN_FILES, MAX_TRACKED_USERS
 from handlers import (start_command,help_command,handle_pdf_file,handle_forwarded_quiz,finish_quiz_batch)
+from middlewares import RateLimitMiddleware
 
 # Initialize logging
 logger = logging.getLogger(__name__)
 
+# Tasks started by this module, cancelled on shutdown
+background_tasks: Set[asyncio.Task] = set()
+
+def spawn(coro: Coroutine) -> asyncio.Task:
+    """
+    Schedule a coroutine on the bot's loop and keep track of it until it finishes
+    
+    Args:
+        coro: Coroutine to run
+        
+    Returns:
+        The scheduled task
+    """
+    task = asyncio.get_event_loop().create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
 # Initialize bot with default properties
 bot = Bot(
     token=TELEGRAM_TOKEN,
@@ -19,6 +44,9 @@ bot = Bot(
 )
 dp = Dispatcher()
 
+# Limit file uploads per user before they reach the handlers
+dp.message.middleware(RateLimitMiddleware(MIN_INTERVAL_BETWEEN_FILES, max_users=MAX_TRACKED_USERS))
+
 # Register handlers - FIXED: Properly await the handler
 dp.message(Command("start"))(start_command)
 dp.message(Command("help"))(help_command)
@@ -29,8 +57,9 @@ dp.message(lambda m: m.forward_origin and m.poll and m.poll.type == 'quiz')(hand
 # Enhanced error handler
 @dp.error()
 async def error_handler(event, exception):
+    handler = getattr(event, 'handler', None)
     error_message = (
-        f"❌ Exception in handler {event.handler.__name__ if hasattr(event, 'handler') else 'unknown'}:\n"
+        f"❌ Exception in handler {handler.__name__ if handler is not None else 'unknown'}:\n"
         f"Type: {type(exception).__name__}\n"
         f"Message: {str(exception)}"
     )
@@ -56,7 +85,7 @@ async def main():
 async def shutdown(signal, loop):
     """Safely shutdown the bot when receiving termination signal"""
     logger.warning(f"Received {signal.name} signal...")
-    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    tasks = [t for t in background_tasks if t is not asyncio.current_task()]
     
     if tasks:
         logger.info(f"Cancelling {len(tasks)} pending tasks...")
@@ -69,7 +98,7 @@ async def shutdown(signal, loop):
 
 if __name__ == "__main__":
     try:
-        loop = asyncio.new_event_loop()
+        loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
     except RuntimeError:
         loop = asyncio.get_event_loop()
@@ -78,13 +107,13 @@ if __name__ == "__main__":
         try:
             loop.add_signal_handler(
                 sig,
-                lambda s=sig: asyncio.create_task(shutdown(s, loop))
+                lambda s=sig: spawn(shutdown(s, loop))
             )
         except NotImplementedError:
             pass
     
     try:
-        loop.run_until_complete(main())
+        loop.run_until_complete(spawn(main()))
     except Exception as e:
         logger.critical(f"Fatal error in main loop: {e}")
     finally:
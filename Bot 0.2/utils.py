@@ -2,24 +2,150 @@ import logging
 import fitz
 import re
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Set, Any, Tuple
 from aiogram import Bot
+from aiolimiter import AsyncLimiter
 from aiogram.enums import ParseMode
 from aiogram.types import Poll
 
 logger = logging.getLogger(__name__)
 
+# Seconds between quiz polls sent to one chat
+SEND_INTERVAL = 1.0
+
+_ANSWER_LABEL = r"(?:Answer|Answers?|الإجابة|الاجابة):"
+
+def _options_block(letter: str) -> str:
+    """
+    Regex for 2-10 option lines numbered with `letter`, e.g. "a) ..." or "a. ...".
+    
+    An option may wrap onto following lines, but a wrapped line is never
+    blank and never starts another option or the answer, so every line
+    has exactly one reading and a failed match is abandoned without
+    backtracking. Blank lines (e.g. from a page break) may separate options.
+    """
+    option = rf"{letter}[.)][^\n]*(?:\n(?!{letter}[.)]|{_ANSWER_LABEL})[^\n]+)*"
+    return rf"{option}(?:\n+{option}){{1,9}}"
+
+# One pattern for every supported question format. Each numbering type
+# (a, A, أ, 1), with ")" or "." after the option letter, is a named
+# alternative of the options block, so the text is swept once and the
+# group that matched selects the option parser and answer decoder.
+# The question text is bounded (well above Telegram's 300 character
+# limit) so a question number without options gives up after a few lines.
+_QUESTION_RE = re.compile(
+    r"(?P<qnum>\d+[-\.]?\s*)(?P<body>.{0,1000}?)\n+(?:"
+    r"(?P<lower>" + _options_block(r"[a-d]") + r")"
+    r"|(?P<upper>" + _options_block(r"[A-D]") + r")"
+    r"|(?P<ar>" + _options_block(r"[\u0623-\u064A]") + r")"
+    r"|(?P<digit>" + _options_block(r"[1-9]") + r")"
+    r")\n+" + _ANSWER_LABEL + r"\s*(?P<answer>[a-dA-D1-9\u0623-\u064A])\)?",
+    re.DOTALL
+)
+
+_ARABIC_OPTION_LETTERS = 'أبجدهوزحطي'
+
+def _option_labels(letters: str) -> Tuple[str, ...]:
+    """Every prefix that starts an option numbered with `letters`: "a)", "a.", ..."""
+    return tuple(letter + separator for letter in letters for separator in ').')
+
+# Option labels and answer decoder for each numbering type
+_OPTION_PARSERS = {
+    'lower': (
+        _option_labels('abcd'),
+        lambda answer: ord(answer.lower()) - ord('a'),
+    ),
+    'upper': (
+        _option_labels('ABCD'),
+        lambda answer: ord(answer.upper()) - ord('A'),
+    ),
+    'ar': (
+        _option_labels(''.join(map(chr, range(0x0623, 0x064B)))),
+        _ARABIC_OPTION_LETTERS.find,
+    ),
+    'digit': (
+        _option_labels('123456789'),
+        lambda answer: int(answer) - 1,
+    ),
+}
+
+def _split_options(options_text: str, labels: Tuple[str, ...]) -> List[str]:
+    """
+    Split an options block into option texts, one per labelled line.
+    
+    Lines that do not start with a label belong to the option above them,
+    so options wrapped over several lines are kept whole. A label with no
+    text yet takes the following lines as its text, even if they look
+    like labels themselves.
+    
+    Args:
+        options_text: Options block, starting with the first label
+        labels: Prefixes that start an option, e.g. ("a)", "a.", ...)
+        
+    Returns:
+        Option texts in order, without their labels
+    """
+    options = []
+    current: List[str] = []
+    has_text = False
+    for line in options_text.split('\n'):
+        if line.startswith(labels) and (has_text or not current):
+            if current:
+                options.append('\n'.join(current).strip())
+            current = [line[2:]]
+            has_text = bool(line[2:].strip())
+        elif current:
+            current.append(line)
+            has_text = has_text or bool(line.strip())
+    if current:
+        options.append('\n'.join(current).strip())
+    return options
+
+# PyMuPDF text extraction flags: the get_text("text") defaults, minus
+# ligature preservation. Images, vector graphics, structure and exact glyph
+# boxes are never collected, so diagrams on a page cost no more than the
+# content stream parse itself
+_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~(
+    fitz.TEXT_PRESERVE_LIGATURES
+    | fitz.TEXT_PRESERVE_IMAGES
+    | fitz.TEXT_COLLECT_VECTORS
+    | fitz.TEXT_COLLECT_STRUCTURE
+    | fitz.TEXT_ACCURATE_BBOXES
+)
+
+# Arabic-Indic numbers for formatted quiz options: ١ ٢ ... ٩ ١٠ (a poll has at most 10)
+_OPTION_NUMBERS = tuple(chr(0x0661 + i) for i in range(9)) + ('١٠',)
+
+# Whitespace cleanup
+# Runs of spaces become one space and blank lines become one empty line,
+# in a single pass: sub(r'\1\1\2') keeps "\n\n" or " " depending on the branch
+_WHITESPACE_RE = re.compile(r'(\n)\s*\n|( ) +')
+_EXTRA_NEWLINES_RE = re.compile(r'\n{3,}')
+
+# PyMuPDF is not thread-safe: every fitz call runs on this one thread, so
+# uploads that arrive together never use it concurrently
+_fitz_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fitz")
+
 async def extract_text_from_pdf(pdf_path: str) -> str:
     """
     Extract text from PDF file with optimized formatting preservation.
     
+    PyMuPDF does the work synchronously, so it runs on a dedicated thread
+    to keep the event loop free for other updates.
+    
     Args:
         pdf_path: Path to the PDF file
         
     Returns:
         Extracted text with preserved formatting
     """
-    text = ""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_fitz_executor, _extract_text_from_pdf_sync, pdf_path)
+
+def _extract_text_from_pdf_sync(pdf_path: str) -> str:
+    """Blocking implementation of extract_text_from_pdf"""
+    parts = []
     try:
         with fitz.open(pdf_path) as doc:
             page_count = len(doc)
@@ -31,33 +157,20 @@ async def extract_text_from_pdf(pdf_path: str) -> str:
             
             for page_num, page in enumerate(doc):
                 try:
-                    # Get text with better formatting
-                    page_text = page.get_text("text")
-                    # Clean up excessive whitespace while preserving format
-                    page_text = re.sub(r' +', ' ', page_text)
-                    page_text = re.sub(r'\n\s*\n', '\n\n', page_text)
-                    
-                    text += page_text + "\n\n"
+                    # Plain text, with ligatures such as "fi" expanded so
+                    # the question patterns see ordinary letters
+                    textpage = page.get_textpage(flags=_TEXT_FLAGS)
+                    parts.append(textpage.extractText())
                 except Exception as e:
                     logger.error(f"Error extracting text from page {page_num+1}: {str(e)}")
     except Exception as e:
         logger.error(f"Error opening PDF file: {str(e)}")
     
-    return text
-    """Extract text from PDF file with layout preservation"""
-    try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            blocks = page.get_text("blocks")
-            blocks.sort(key=lambda b: (b[1], b[0]))  # Sort by vertical then horizontal
-            for block in blocks:
-                if block[4].strip():  # Skip empty blocks
-                    text += block[4] + "\n"
-        return text.strip()
-    except Exception as e:
-        logger.error(f"PDF extraction error: {e}", exc_info=True)
+    if not parts:
         return ""
+    # Clean up excessive whitespace in one pass over the whole text rather
+    # than per page
+    return _WHITESPACE_RE.sub(r'\1\1\2', "\n\n".join(parts) + "\n\n")
 
 def extract_questions_from_text(text: str) -> List[Dict[str, Any]]:
     """
@@ -70,173 +183,71 @@ def extract_questions_from_text(text: str) -> List[Dict[str, Any]]:
         List of questions with options and correct answers
     """
     # Clean up text
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = _EXTRA_NEWLINES_RE.sub('\n\n', text)
     
     # Log diagnostic info
     logger.info(f"Text extracted from PDF (first 500 chars): {text[:500]}...")
     logger.info(f"Total length of extracted text: {len(text)} characters")
     
     questions = []
-    extracted_questions: Set[str] = set()
-    
-    # Patterns for different question formats
-    patterns = [
-        # Pattern 1: Question with options a) b) c) d) and answer with letter b)
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-d]\).*?(?:\n[a-d]\).*?){1,5})\n+(?:Answer|Answers?):\s*([a-d])\)?",
-        
-        # Pattern 2: Question with options a) b) c) d) and answer with letter and parenthesis like b)
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-d]\).*?(?:\n[a-d]\).*?){1,5})\n+(?:Answer|Answers?):\s*([a-d])\)",
-        
-        # More flexible pattern
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-d]\)\s*.*?(?:\n[a-d]\)\s*.*?){1,5})\n+(?:Answer|Answers?):\s*([a-d])\)?",
-        
-        # Pattern 3: Question with options A) B) C) D) (uppercase)
-        r"(\d+[-\.]?\s*)(.*?)\n+([A-D]\).*?(?:\n[A-D]\).*?){1,5})\n+(?:Answer|Answers?):\s*([A-D])",
-        
-        # Pattern 4: Question with options أ) ب) ج) د) (Arabic)
-        r"(\d+[-\.]?\s*)(.*?)\n+([\u0623-\u064A]\).*?(?:\n[\u0623-\u064A]\).*?){1,5})\n+(?:الإجابة|الاجابة):\s*([\u0623-\u064A])",
-        
-        # Pattern 5: Question with options 1) 2) 3) 4)
-        r"(\d+[-\.]?\s*)(.*?)\n+([1-9]\).*?(?:\n[1-9]\).*?){1,5})\n+(?:Answer|Answers?):\s*([1-9])",
-        
-        # Pattern 6-9: Various formats with different separators and languages
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-d]\.\s*.*?(?:\n[a-d]\.\s*.*?){1,5})\n+(?:Answer|Answers?):\s*([a-d])",
-        r"(\d+[-\.]?\s*)(.*?)\n+([A-D]\.\s*.*?(?:\n[A-D]\.\s*.*?){1,5})\n+(?:Answer|Answers?):\s*([A-D])",
-        r"(\d+[-\.]?\s*)(.*?)\n+([\u0623-\u064A]\.\s*.*?(?:\n[\u0623-\u064A]\.\s*.*?){1,5})\n+(?:الإجابة|الاجابة):\s*([\u0623-\u064A])",
-        r"(\d+[-\.]?\s*)(.*?)\n+([1-9]\.\s*.*?(?:\n[1-9]\.\s*.*?){1,5})\n+(?:Answer|Answers?):\s*([1-9])",
-        
-        # Pattern 10: More flexible pattern for irregular formatting
-        r"(\d+[-\.]?\s*)(.*?)\n+(?:[^\n]*?choice.*?|[^\n]*?option.*?|[^\n]*?الخيار.*?)(?:\n[^\n]*?choice.*?|\n[^\n]*?option.*?|\n[^\n]*?الخيار.*?){1,5}\n+(?:answer|answers?|الإجابة|الاجابة):\s*([a-dA-D1-9\u0623-\u064A])",
-        
-        # Pattern 11: More flexible format for options (a - option, b - option)
-        r"(\d+[-\.]?\s*)(.*?)\n+([a-dA-D])\s*[-–—]\s*(.*?)(?:\n([a-dA-D])\s*[-–—]\s*(.*?)){1,5}\n+(?:Answer|Answers?):\s*([a-dA-D])"
-    ]
-    
-    # Process each pattern
-    for i, pattern in enumerate(patterns):
-        matches = re.findall(pattern, text, re.DOTALL)
-        logger.info(f"Pattern {i+1}: Found {len(matches)} matches")
-        
-        for match in matches:
-            try:
-                question_num = match[0].strip()
-                question_text = match[1].strip()
-                
-                # Add question number to text if present
-                if question_num:
-                    question_text = f"{question_num} {question_text}"
-                
-                # Extract all options
-                options_text = match[2].strip()
-                
-                # Determine numbering type (a, A, أ, 1)
-                if options_text.startswith(('a', 'b', 'c', 'd')):
-                    options_raw = re.findall(r'([a-d]\))\s*(.*?)(?=\n[a-d]\)|$)', options_text, re.DOTALL)
-                    correct_answer = match[3].strip().lower()
-                    if correct_answer.endswith(')'):
-                        correct_answer = correct_answer[:-1]
-                    correct_index = ord(correct_answer) - ord('a')
-                elif options_text.startswith(('A', 'B', 'C', 'D')):
-                    options_raw = re.findall(r'([A-D]\))\s*(.*?)(?=\n[A-D]\)|$)', options_text, re.DOTALL)
-                    correct_answer = match[3].strip().upper()
-                    correct_index = ord(correct_answer) - ord('A')
-                elif options_text[0] in 'أبجدهوزحطي':  # Arabic letters
-                    options_raw = re.findall(r'([\u0623-\u064A]\))\s*(.*?)(?=\n[\u0623-\u064A]\)|$)', options_text, re.DOTALL)
-                    correct_answer = match[3].strip()
-                    arabic_options = 'أبجدهوزحطي'
-                    correct_index = arabic_options.find(correct_answer)
-                else:  # Numbers
-                    options_raw = re.findall(r'([1-9]\))\s*(.*?)(?=\n[1-9]\)|$)', options_text, re.DOTALL)
-                    correct_answer = match[3].strip()
-                    correct_index = int(correct_answer) - 1
-                
-                options = []
-                for opt in options_raw:
-                    option_text = opt[1].strip()
-                    options.append(option_text)
-                
-                # Ensure correct answer is within range
-                if 0 <= correct_index < len(options):
-                    # Create unique ID for question
-                    question_id = question_text[:50]
-                    if question_id not in extracted_questions:
-                        questions.append({
-                            "question": question_text,
-                            "options": options,
-                            "correct_option_id": correct_index
-                        })
-                        extracted_questions.add(question_id)
-                        logger.info(f"Added new question: {question_id}")
-                    else:
-                        logger.info(f"Skipped duplicate question: {question_id}")
-            except Exception as e:
-                logger.warning(f"Error extracting question: {str(e)}")
-                continue
-    
-    return questions
-    """
-    Extract questions from text with support for multiple formats
-    
-    Args:
-        text: Extracted text from PDF
-        
-    Returns:
-        List of question dictionaries with 'question', 'options', and 'correct_option_id'
-    """
-    questions = []
+    extracted_questions: Set[int] = set()
     
-    # Pattern that matches your exact format
-    pattern = r"""
-        (?:^|\n)                      # Start of line
-        (\d+-)?                       # Optional question number
-        (.*?)                         # Question text
-        \s*\n+                        # Whitespace
-        ((?:                          # Options block:
-           [a-d]\)\s*.+?              # Option line
-           (?:\n|$)                   # End of line
-        ){2,})                        # At least 2 options
-        \s*                           # Whitespace
-        Answer:\s*([a-d])             # Correct answer
-        """
-    
-    try:
-        matches = re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE | re.VERBOSE)
-        
-        for match in matches:
-            question_text = match.group(2).strip()
-            options_block = match.group(3).strip()
-            correct_answer = match.group(4).strip().lower()
+    match_count = 0
+    for match in _QUESTION_RE.finditer(text):
+        match_count += 1
+        try:
+            question_num = match['qnum'].strip()
+            question_text = match['body'].strip()
             
-            # Extract clean options
-            options = []
-            option_lines = re.finditer(r'^([a-d])\)\s*(.+?)(?=\n[a-d]\)|\n*$)', 
-                                     options_block, re.MULTILINE)
-            for opt in option_lines:
-                options.append(opt.group(2).strip())
+            # Add question number to text if present
+            if question_num:
+                question_text = f"{question_num} {question_text}"
             
-            if len(options) >= 2:
-                try:
-                    correct_index = ord(correct_answer) - ord('a')
-                    if 0 <= correct_index < len(options):
-                        questions.append({
-                            'question': question_text,
-                            'options': options,
-                            'correct_option_id': correct_index
-                        })
-                except Exception as e:
-                    logger.warning(f"Question format error: {e}")
-    except Exception as e:
-        logger.error(f"Regex error: {e}")
+            # The options group that matched gives the numbering type
+            style = next(name for name in _OPTION_PARSERS if match[name] is not None)
+            labels, decode_answer = _OPTION_PARSERS[style]
+            options = _split_options(match[style].strip(), labels)
+            
+            correct_index = decode_answer(match['answer'])
+            
+            # Ensure correct answer is within range
+            if 0 <= correct_index < len(options):
+                # Dedup on the hash of the whole question text; a clash
+                # within one document is vanishingly unlikely
+                question_id = hash(question_text)
+                if question_id not in extracted_questions:
+                    questions.append({
+                        "question": question_text,
+                        "options": options,
+                        "correct_option_id": correct_index
+                    })
+                    extracted_questions.add(question_id)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Added new question: %s", question_text[:50])
+                elif logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Skipped duplicate question: %s", question_text[:50])
+        except Exception as e:
+            logger.warning(f"Error extracting question: {str(e)}")
+            continue
     
+    logger.info(f"Found {match_count} matches")
     return questions
 
 async def send_telegram_quizzes(bot: Bot, questions: List[Dict[str, Any]], chat_id: int) -> Tuple[int, int]:
-    """Send questions as Telegram quizzes"""
-    sent_count = 0
-    error_count = 0
+    """
+    Send questions as Telegram quizzes
     
-    for q in questions:
-        try:
+    Polls are sent one at a time, in order, and start at most every
+    SEND_INTERVAL seconds to avoid flood limits. The interval counts from
+    the previous start rather than being slept after each response, so the
+    spacing is the larger of the interval and the round trip.
+    """
+    limiter = AsyncLimiter(1, SEND_INTERVAL)
+    # One poll in flight at a time keeps them in order in the chat
+    in_order = asyncio.Semaphore(1)
+    
+    async def send_quiz(q: Dict[str, Any]) -> None:
+        async with in_order, limiter:
             await bot.send_poll(
                 chat_id=chat_id,
                 question=q['question'],
@@ -245,30 +256,36 @@ async def send_telegram_quizzes(bot: Bot, questions: List[Dict[str, Any]], chat_
                 correct_option_id=q['correct_option_id'],
                 is_anonymous=False
             )
-            sent_count += 1
-            await asyncio.sleep(0.5)  # Avoid flood limits
-        except Exception as e:
-            logger.error(f"Error sending quiz: {e}")
+    
+    results = await asyncio.gather(*(send_quiz(q) for q in questions), return_exceptions=True)
+    
+    error_count = 0
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Error sending quiz: {result}")
             error_count += 1
     
-    return sent_count, error_count
+    return len(results) - error_count, error_count
 
-async def format_quiz_as_text(quiz: Poll) -> str:
+def format_quiz_as_text(quiz: Poll) -> str:
     """Convert a single Telegram quiz to text format"""
     try:
-        text = f"📝 السؤال:\n{quiz.question}\n\nالخيارات:\n"
-        for i, option in enumerate(quiz.options):
+        parts = [f"📝 السؤال:\n{quiz.question}\n\nالخيارات:\n"]
+        for number, option in zip(_OPTION_NUMBERS, quiz.options):
             # Check if option is a string or has text attribute
-            option_text = option.text if hasattr(option, 'text') else str(option)
-            text += f"{chr(1633 + i)}) {option_text}\n"  # Arabic numbering
+            option_text = getattr(option, 'text', None)
+            if option_text is None:
+                option_text = str(option)
+            parts.append(f"{number}) {option_text}\n")
             
         # Check if correct_option_id exists and is not None
-        if hasattr(quiz, 'correct_option_id') and quiz.correct_option_id is not None:
-            text += f"\n✅ الإجابة الصحيحة: {chr(1633 + quiz.correct_option_id)}"
+        correct_option_id = getattr(quiz, 'correct_option_id', None)
+        if correct_option_id is not None:
+            parts.append(f"\n✅ الإجابة الصحيحة: {_OPTION_NUMBERS[correct_option_id]}")
         else:
-            text += "\n❓ الإجابة غير متوفرة"
+            parts.append("\n❓ الإجابة غير متوفرة")
             
-        return text
+        return "".join(parts)
     except Exception as e:
         logger.error(f"Error formatting quiz: {e}", exc_info=True)
         return "❌ خطأ في تحويل الاختبار إلى نص"
\ No newline at end of file